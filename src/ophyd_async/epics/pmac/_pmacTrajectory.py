@@ -1,4 +1,10 @@
+import asyncio
+import math
+import re
 import time
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Optional
 
 import numpy as np
 import numpy.typing as npt
@@ -13,6 +19,55 @@ from ophyd_async.epics.motion import Motor
 from ophyd_async.epics.pmac import Pmac
 
 TICK_S = 0.000001
+_INV_TICK = 1.0 / TICK_S
+# The PMAC time array holds each point's duration in ticks as an int32
+_MAX_TICKS = np.iinfo(np.int32).max
+# Matches a compound motor output link "@asyn(PORT,num)"
+_CS_RE = re.compile(r"@asyn\(([^,]+),\s*(\d+)\s*\)")
+
+
+def _seconds_to_ticks(seconds: npt.NDArray[np.float64]) -> npt.NDArray[np.int32]:
+    ticks = np.rint(seconds * _INV_TICK)
+    if ticks.min() < 0 or ticks.max() > _MAX_TICKS:
+        raise ValueError(
+            f"Trajectory point durations must be between 0 and "
+            f"{_MAX_TICKS * TICK_S}s, got {seconds.min()} to {seconds.max()}s"
+        )
+    return ticks.astype(np.int32)
+
+
+@lru_cache(maxsize=8)
+def _calculate_profile(
+    motor: Motor,
+    start_position: float,
+    end_position: float,
+    num_positions: int,
+    time_per_position: float,
+) -> tuple[
+    Mapping[Motor, npt.NDArray[np.float64]],
+    Mapping[Motor, npt.NDArray[np.float64]],
+    npt.NDArray[np.float64],
+]:
+    """Calculate the midpoints, velocities and durations of a fly scan of motor.
+
+    The results are shared between calls so the mappings and arrays are
+    read-only. The cache holds strong references to the motors of the last 8
+    distinct trajectories, keeping those devices alive.
+    """
+    spec = fly(
+        Line(motor, start_position, end_position, num_positions), time_per_position
+    )
+    chunk = Path(spec.calculate()).consume()
+    durations = np.asarray(chunk.midpoints["DURATION"], dtype=np.float64)
+    positions: dict[Motor, npt.NDArray[np.float64]] = {}
+    velocities: dict[Motor, npt.NDArray[np.float64]] = {}
+    for axis in chunk.axes():
+        if axis != "DURATION":
+            positions[axis] = np.asarray(chunk.midpoints[axis], dtype=np.float64)
+            velocities[axis] = (chunk.upper[axis] - chunk.lower[axis]) / durations
+    for array in (durations, *positions.values(), *velocities.values()):
+        array.setflags(write=False)
+    return MappingProxyType(positions), MappingProxyType(velocities), durations
 
 
 class FlyTrajectoryInfo(BaseModel):
@@ -43,12 +98,21 @@ class PmacTrajectory(Pmac, Flyable, Preparable):
         self.motor = motor
         super().__init__(prefix, cs, name=name)
 
-    async def _ramp_up_velocity_pos(
-        self, velocity: float, motor: Motor, end_velocity: float
+    async def _get_ramp_params(self, motor: Motor) -> tuple[float, float]:
+        max_velocity_acceleration_time, max_velocity = await asyncio.gather(
+            motor.acceleration_time.get_value(),
+            motor.max_velocity.get_value(),
+        )
+        return max_velocity_acceleration_time, max_velocity
+
+    def _ramp_up_velocity_pos(
+        self,
+        velocity: float,
+        end_velocity: float,
+        max_velocity_acceleration_time: float,
+        max_velocity: float,
     ):
         # Assuming ramping to or from 0
-        max_velocity_acceleration_time = await motor.acceleration_time.get_value()
-        max_velocity = await motor.max_velocity.get_value()
         delta_v = abs(end_velocity - velocity)
         accl_time = max_velocity_acceleration_time * delta_v / max_velocity
         disp = 0.5 * (velocity + end_velocity) * accl_time
@@ -56,105 +120,102 @@ class PmacTrajectory(Pmac, Flyable, Preparable):
 
     @AsyncStatus.wrap
     async def prepare(self, value: FlyTrajectoryInfo):
-        # Which Axes are in use?
-
-        spec = fly(
-            Line(
-                self.motor,
-                value.start_position,
-                value.end_position,
-                value.num_positions,
-            ),
+        motor_positions, motor_velocities, durations = _calculate_profile(
+            self.motor,
+            value.start_position,
+            value.end_position,
+            value.num_positions,
             value.time_per_position,
         )
-        stack = spec.calculate()
-        path = Path(stack)
-        chunk = path.consume()
-        scan_size = len(chunk)
-        scan_axes = chunk.axes()
+        scan_size = len(durations)
+        # Which Axes are in use?
+        motors = list(motor_positions)
+
+        cs_infos = await asyncio.gather(*(self.get_cs_info(axis) for axis in motors))
+        cs_port: Optional[str] = None
+        cs_axes: dict[Motor, int] = {}
+        for axis, (axis_cs_port, cs_index) in zip(motors, cs_infos):
+            if cs_port is None:
+                cs_port = axis_cs_port
+            elif axis_cs_port != cs_port:
+                raise ValueError(
+                    f"Motors in more than one CS: {cs_port} and {axis_cs_port}"
+                )
+            cs_axes[axis] = cs_index
 
-        cs_ports = set()
+        # Leave a slot at the end of each array for the ramp down point
         positions: dict[int, npt.NDArray[np.float64]] = {}
         velocities: dict[int, npt.NDArray[np.float64]] = {}
-        time_array: npt.NDArray[np.float64] = []
-        cs_axes: dict[Motor, int] = {}
-        for axis in scan_axes:
-            if axis != "DURATION":
-                cs_port, cs_index = await self.get_cs_info(axis)
-                positions[cs_index] = []
-                velocities[cs_index] = []
-                cs_ports.add(cs_port)
-                cs_axes[axis] = cs_index
-        assert len(cs_ports) == 1, "Motors in more than one CS"
-        cs_port = cs_ports.pop()
-        self.scantime = sum(chunk.midpoints["DURATION"])
-
-        # Calc Velocity
-
-        for axis in scan_axes:
-            for i in range(scan_size):
-                if axis != "DURATION":
-                    velocities[cs_axes[axis]].append(
-                        (chunk.upper[axis][i] - chunk.lower[axis][i])
-                        / (chunk.midpoints["DURATION"][i])
-                    )
-                    positions[cs_axes[axis]].append(chunk.midpoints[axis][i])
-                else:
-                    time_array.append(int(chunk.midpoints[axis][i] / TICK_S))
+        for cs_index in cs_axes.values():
+            positions[cs_index] = np.empty(scan_size + 1, dtype=np.float64)
+            velocities[cs_index] = np.empty(scan_size + 1, dtype=np.float64)
+        point_times = np.empty(scan_size + 1, dtype=np.float64)
+        self.scantime = float(durations.sum())
+
+        for axis in motors:
+            velocities[cs_axes[axis]][:scan_size] = motor_velocities[axis]
+            positions[cs_axes[axis]][:scan_size] = motor_positions[axis]
+        point_times[:scan_size] = durations
 
         # Calculate Starting and end Position to allow ramp up and trail off velocity
         self.initial_pos = {}
         run_up_time = 0
         final_time = 0
-        for axis in scan_axes:
-            if axis != "DURATION":
-                run_up_disp, run_up_t = await self._ramp_up_velocity_pos(
+        motor_params = dict(
+            zip(
+                motors,
+                await asyncio.gather(*(self._get_ramp_params(axis) for axis in motors)),
+            )
+        )
+        for axis in motors:
+            v_first = float(velocities[cs_axes[axis]][0])
+            v_last = float(velocities[cs_axes[axis]][scan_size - 1])
+            run_up_disp, run_up_t = self._ramp_up_velocity_pos(
+                0, v_first, *motor_params[axis]
+            )
+            self.initial_pos[cs_axes[axis]] = positions[cs_axes[axis]][0] - run_up_disp
+            # trail off position and time
+            if math.isclose(v_first, v_last, rel_tol=1e-12):
+                final_pos = positions[cs_axes[axis]][scan_size - 1] + run_up_disp
+                final_time = run_up_t
+            else:
+                ramp_down_disp, ramp_down_time = self._ramp_up_velocity_pos(
+                    v_last,
                     0,
-                    axis,
-                    velocities[cs_axes[axis]][0],
+                    *motor_params[axis],
                 )
-                self.initial_pos[cs_axes[axis]] = (
-                    positions[cs_axes[axis]][0] - run_up_disp
-                )
-                # trail off position and time
-                if velocities[cs_axes[axis]][0] == velocities[cs_axes[axis]][-1]:
-                    final_pos = positions[cs_axes[axis]][-1] + run_up_disp
-                    final_time = run_up_t
-                else:
-                    ramp_down_disp, ramp_down_time = await self._ramp_up_velocity_pos(
-                        velocities[cs_axes[axis]][-1],
-                        axis,
-                        0,
-                    )
-                    final_pos = positions[cs_axes[axis]][-1] + ramp_down_disp
-                    final_time = max(ramp_down_time, final_time)
-                positions[cs_axes[axis]].append(final_pos)
-                velocities[cs_axes[axis]].append(0)
-                run_up_time = max(run_up_time, run_up_t)
+                final_pos = positions[cs_axes[axis]][scan_size - 1] + ramp_down_disp
+                final_time = max(ramp_down_time, final_time)
+            positions[cs_axes[axis]][scan_size] = final_pos
+            velocities[cs_axes[axis]][scan_size] = 0.0
+            run_up_time = max(run_up_time, run_up_t)
 
         self.scantime += run_up_time + final_time
-        time_array[0] += run_up_time / TICK_S
-        time_array.append(int(final_time / TICK_S))
-
-        for axis in scan_axes:
-            if axis != "DURATION":
-                self.profile_cs_name.set(cs_port)
-                self.points_to_build.set(scan_size + 1)
-                self.use_axis[cs_axes[axis] + 1].set(True)
-                self.positions[cs_axes[axis] + 1].set(positions[cs_axes[axis]])
-                self.velocities[cs_axes[axis] + 1].set(velocities[cs_axes[axis]])
-            else:
-                self.time_array.set(time_array)
+        point_times[0] += run_up_time
+        point_times[scan_size] = final_time
+        time_array = _seconds_to_ticks(point_times)
 
-        # MOVE TO START
-        for axis in scan_axes:
-            if axis != "DURATION":
-                await axis.set(self.initial_pos[cs_axes[axis]])
+        ops = [
+            self.profile_cs_name.set(cs_port),
+            self.points_to_build.set(scan_size + 1),
+            self.time_array.set(time_array),
+            # Set PMAC to use Velocity Array
+            self.profile_calc_vel.set(False),
+        ]
+        for axis in motors:
+            # CS axis signals are 1 indexed
+            pv_index = cs_axes[axis] + 1
+            ops.append(self.use_axis[pv_index].set(True))
+            ops.append(self.positions[pv_index].set(positions[cs_axes[axis]]))
+            ops.append(self.velocities[pv_index].set(velocities[cs_axes[axis]]))
+        await asyncio.gather(*ops)
 
-        # Set PMAC to use Velocity Array
-        self.profile_calc_vel.set(False)
+        # MOVE TO START
+        await asyncio.gather(
+            *(axis.set(self.initial_pos[cs_axes[axis]]) for axis in motors)
+        )
 
-        self.build_profile.set(True)
+        await self.build_profile.set(True)
         self._fly_start = time.monotonic()
 
     @AsyncStatus.wrap
@@ -163,7 +224,12 @@ class PmacTrajectory(Pmac, Flyable, Preparable):
 
     @WatchableAsyncStatus.wrap
     async def complete(self):
+        last_emitted = -1.0
         async for percent in observe_value(self.scan_percent):
+            # Only report whole percent steps, the progress has precision 0
+            if percent - last_emitted < 1 and percent < 100:
+                continue
+            last_emitted = percent
             yield WatcherUpdate(
                 name=self.name,
                 current=percent,
@@ -178,9 +244,13 @@ class PmacTrajectory(Pmac, Flyable, Preparable):
 
     async def get_cs_info(self, motor: Motor) -> tuple[str, int]:
         output_link = await motor.output_link.get_value()
-        # Split "@asyn(PORT,num)" into ["PORT", "num"]
-        split = output_link.split("(")[1].rstrip(")").split(",")
-        cs_port = split[0].strip()
+        match = _CS_RE.search(output_link)
+        if match is None:
+            raise ValueError(
+                f"{motor.name} output link {output_link!r} is not of the form "
+                "'@asyn(PORT,num)'"
+            )
+        cs_port = match.group(1).strip()
         assert "CS" in cs_port, f"{self.name} not in a CS. It is not a compound motor."
-        cs_index = int(split[1].strip()) - 1
+        cs_index = int(match.group(2)) - 1
         return cs_port, cs_index
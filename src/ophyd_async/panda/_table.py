@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import Sequence, TypeVar
+from typing import Sequence, TypeVar, Union
 
 import numpy as np
 import numpy.typing as npt
@@ -35,6 +35,69 @@ class SeqTrigger(str, Enum):
     POSC_LT = "POSC<=POSITION"
 
 
+# PandA encodes each trigger as its index in the SEQ trigger enum
+_TRIG_CODE = {trigger: code for code, trigger in enumerate(SeqTrigger)}
+
+
+def triggers_to_codes(
+    trigger: Union[Sequence[SeqTrigger], npt.NDArray[np.integer]],
+) -> npt.NDArray[np.uint8]:
+    """
+    Converts a sequence of SeqTrigger into an array of PandA trigger codes.
+    An integer array is assumed to hold codes already, and is range checked
+    then returned as uint8. A uint8 array of valid codes is returned as is.
+    """
+    if isinstance(trigger, np.ndarray):
+        if not np.issubdtype(trigger.dtype, np.integer):
+            raise TypeError(
+                f"Expected SeqTrigger values or an integer array of trigger codes, "
+                f"got an array of {trigger.dtype}"
+            )
+        if len(trigger) and (trigger.min() < 0 or trigger.max() >= len(_TRIG_CODE)):
+            raise ValueError(
+                f"Trigger codes must be between 0 and {len(_TRIG_CODE) - 1}"
+            )
+        return trigger.astype(np.uint8, copy=False)
+    try:
+        return np.fromiter(
+            (_TRIG_CODE[t] for t in trigger), dtype=np.uint8, count=len(trigger)
+        )
+    except KeyError as e:
+        raise TypeError(
+            f"Expected SeqTrigger values or an integer array of trigger codes, "
+            f"got {e.args[0]!r}"
+        ) from e
+
+
+# Column layout of a sequencer table, in the order PandA expects. The six
+# outputs of each phase are packed into one byte, bit 0 being outa
+_SEQ_DTYPE = np.dtype(
+    [
+        ("repeats", np.uint16),
+        ("trigger", np.uint8),
+        ("position", np.int32),
+        ("time1", np.uint32),
+        ("out1", np.uint8),
+        ("time2", np.uint32),
+        ("out2", np.uint8),
+    ]
+)
+_SEQ_OUTPUTS = ("outa", "outb", "outc", "outd", "oute", "outf")
+# Packed output column for each sequencer phase
+_SEQ_OUT_PHASES = {"out1": 1, "out2": 2}
+
+
+def _pack_outputs(rows: Sequence["SeqTableRow"], phase: int) -> npt.NDArray[np.uint8]:
+    bits = np.zeros((len(rows), 8), dtype=np.uint8)
+    for i, output in enumerate(_SEQ_OUTPUTS):
+        bits[:, i] = np.fromiter(
+            (getattr(row, f"{output}{phase}") for row in rows),
+            dtype=np.bool_,
+            count=len(rows),
+        )
+    return np.packbits(bits, axis=1, bitorder="little").ravel()
+
+
 @dataclass
 class SeqTableRow:
     repeats: int = 1
@@ -55,6 +118,35 @@ class SeqTableRow:
     oute2: bool = False
     outf2: bool = False
 
+    @classmethod
+    def to_soa(cls, rows: Sequence["SeqTableRow"]) -> dict[str, npt.NDArray]:
+        """
+        Converts a sequence of rows into a dict of contiguous column arrays
+        with the dtypes of the sequencer table.
+        trigger is encoded as PandA trigger codes, and the outputs of each
+        phase are packed into the bitfield columns out1 and out2.
+        """
+        length = len(rows)
+        columns: dict[str, npt.NDArray] = {}
+        for name, (dtype, _) in _SEQ_DTYPE.fields.items():
+            if name == "trigger":
+                columns[name] = triggers_to_codes([row.trigger for row in rows])
+            elif name in _SEQ_OUT_PHASES:
+                columns[name] = _pack_outputs(rows, _SEQ_OUT_PHASES[name])
+            else:
+                # Build wide then narrow so out of range values are not wrapped
+                values = np.fromiter(
+                    (getattr(row, name) for row in rows), dtype=np.int64, count=length
+                )
+                limits = np.iinfo(dtype)
+                if length and (values.min() < limits.min or values.max() > limits.max):
+                    raise ValueError(
+                        f"{name}: values must be between {limits.min} and "
+                        f"{limits.max}, got {values.min()} to {values.max()}"
+                    )
+                columns[name] = values.astype(dtype)
+        return columns
+
 
 # class SeqTable(TypedDict):
 #     repeats: NotRequired[pnd.Np1DArrayUint16]
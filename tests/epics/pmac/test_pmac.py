@@ -1,9 +1,11 @@
+import asyncio
+
+import numpy as np
 import pytest
-from scanspec.specs import Line, fly
 
 from ophyd_async.core import DeviceCollector, set_mock_value
 from ophyd_async.epics.motion import Motor
-from ophyd_async.epics.pmac import PmacTrajectory
+from ophyd_async.epics.pmac import FlyTrajectoryInfo, PmacTrajectory, _pmacTrajectory
 
 
 @pytest.fixture
@@ -21,39 +23,31 @@ async def sim_x_motor():
     yield sim_motor
 
 
-async def test_sim_pmac_simple_trajectory(sim_x_motor) -> None:
-    # Test the generated Trajectory profile from a scanspec
-    prefix = "BLxxI-MO-STEP-01"
+@pytest.fixture
+async def sim_pmac(sim_x_motor):
     async with DeviceCollector(mock=True):
-        traj = PmacTrajectory(prefix, "BRICK1.CS3", name="sim_pmac")
-    spec = fly(Line(sim_x_motor, 1, 5, 9), 1)
-    stack = spec.calculate()
-    await traj.prepare(stack)
-    assert await traj.positions[9].get_value() == [
-        1,
-        1.5,
-        2,
-        2.5,
-        3,
-        3.5,
-        4,
-        4.5,
-        5,
-        5.0125,
-    ]
-    assert await traj.velocities[9].get_value() == [
-        0.5,
-        0.5,
-        0.5,
-        0.5,
-        0.5,
-        0.5,
-        0.5,
-        0.5,
-        0.5,
-        0,
-    ]
-    assert await traj.time_array.get_value() == [
+        traj = PmacTrajectory(
+            "BLxxI-MO-STEP-01", "BRICK1.CS3", sim_x_motor, name="sim_pmac"
+        )
+    yield traj
+
+
+async def test_sim_pmac_simple_trajectory(sim_pmac, sim_x_motor) -> None:
+    # Test the generated Trajectory profile from a scanspec
+    await sim_pmac.prepare(
+        FlyTrajectoryInfo(
+            start_position=1, end_position=5, num_positions=9, time_per_position=1
+        )
+    )
+    assert (await sim_pmac.positions[9].get_value()).tolist() == pytest.approx(
+        [1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5, 5.0125]
+    )
+    assert (await sim_pmac.velocities[9].get_value()).tolist() == pytest.approx(
+        [0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0]
+    )
+    time_array = await sim_pmac.time_array.get_value()
+    assert time_array.dtype == np.int32
+    assert time_array.tolist() == [
         1050000,
         1000000,
         1000000,
@@ -65,8 +59,113 @@ async def test_sim_pmac_simple_trajectory(sim_x_motor) -> None:
         1000000,
         50000,
     ]
-    assert await traj.points_to_build.get_value() == 10
-    assert await sim_x_motor.user_setpoint.get_value() == 0.9875
-    assert traj.scantime == 9.1
+    assert await sim_pmac.points_to_build.get_value() == 10
+    assert await sim_x_motor.user_setpoint.get_value() == pytest.approx(0.9875)
+    assert sim_pmac.scantime == pytest.approx(9.1)
+
+    await sim_pmac.kickoff()
+
+
+async def test_sim_pmac_asymmetric_trajectory(
+    sim_pmac, sim_x_motor, monkeypatch
+) -> None:
+    # A Line always has constant velocity, so inject a profile that speeds up
+    # to exercise the ramp down branch
+    def accelerating_profile(motor, *args):
+        return (
+            {motor: np.array([1.0, 2.0, 4.0])},
+            {motor: np.array([1.0, 2.0, 3.0])},
+            np.array([1.0, 1.0, 1.0]),
+        )
+
+    monkeypatch.setattr(_pmacTrajectory, "_calculate_profile", accelerating_profile)
+    await sim_pmac.prepare(
+        FlyTrajectoryInfo(
+            start_position=1, end_position=4, num_positions=3, time_per_position=1
+        )
+    )
+    # Ramp up from 0 to 1 mm/s takes 0.1s over 0.05mm, ramp down from 3 mm/s
+    # takes 0.3s over 0.45mm
+    assert (await sim_pmac.positions[9].get_value()).tolist() == pytest.approx(
+        [1, 2, 4, 4.45]
+    )
+    assert (await sim_pmac.velocities[9].get_value()).tolist() == pytest.approx(
+        [1, 2, 3, 0]
+    )
+    assert (await sim_pmac.time_array.get_value()).tolist() == [
+        1100000,
+        1000000,
+        1000000,
+        300000,
+    ]
+    assert await sim_pmac.points_to_build.get_value() == 4
+    assert await sim_x_motor.user_setpoint.get_value() == pytest.approx(0.95)
+    assert sim_pmac.scantime == pytest.approx(3.4)
+
+
+async def test_get_cs_info(sim_pmac, sim_x_motor) -> None:
+    assert await sim_pmac.get_cs_info(sim_x_motor) == ("BRICK1.CS3", 8)
+    set_mock_value(sim_x_motor.output_link, "@asyn(BRICK1.CS3, 2 )")
+    assert await sim_pmac.get_cs_info(sim_x_motor) == ("BRICK1.CS3", 1)
+    set_mock_value(sim_x_motor.output_link, "BRICK1.CS3 9")
+    with pytest.raises(ValueError, match="is not of the form"):
+        await sim_pmac.get_cs_info(sim_x_motor)
+
+
+async def test_prepare_rejects_motors_in_different_cs(
+    sim_pmac, sim_x_motor, monkeypatch
+) -> None:
+    async with DeviceCollector(mock=True):
+        sim_y_motor = Motor("BLxxI-MO-STAGE-01:Y", name="sim_y_motor")
+    set_mock_value(sim_y_motor.output_link, "@asyn(BRICK1.CS4,1)")
+
+    def two_motor_profile(motor, *args):
+        positions = np.array([1.0, 2.0])
+        return (
+            {sim_x_motor: positions, sim_y_motor: positions},
+            {sim_x_motor: positions, sim_y_motor: positions},
+            np.array([1.0, 1.0]),
+        )
+
+    monkeypatch.setattr(_pmacTrajectory, "_calculate_profile", two_motor_profile)
+    with pytest.raises(ValueError, match="BRICK1.CS3 and BRICK1.CS4"):
+        await sim_pmac.prepare(
+            FlyTrajectoryInfo(
+                start_position=1, end_position=2, num_positions=2, time_per_position=1
+            )
+        )
+
+
+async def test_complete_only_reports_whole_percent_steps(sim_pmac) -> None:
+    await sim_pmac.prepare(
+        FlyTrajectoryInfo(
+            start_position=1, end_position=5, num_positions=9, time_per_position=1
+        )
+    )
+    reported = []
+    status = sim_pmac.complete()
+    status.watch(lambda current, **kwargs: reported.append(current))
+    # Let complete subscribe to scan_percent before it starts changing
+    await asyncio.sleep(0.01)
+    for percent in (0.3, 0.9, 1.2, 50, 99.8, 100):
+        set_mock_value(sim_pmac.scan_percent, percent)
+    await status
+    assert status.done
+    assert reported == [0, 1.2, 50, 99.8, 100]
+
 
-    await traj.kickoff()
+async def test_prepare_reuses_calculated_profile(sim_pmac) -> None:
+    _pmacTrajectory._calculate_profile.cache_clear()
+    info = FlyTrajectoryInfo(
+        start_position=1, end_position=5, num_positions=9, time_per_position=1
+    )
+    await sim_pmac.prepare(info)
+    await sim_pmac.prepare(info)
+    cache_info = _pmacTrajectory._calculate_profile.cache_info()
+    assert (cache_info.misses, cache_info.hits) == (1, 1)
+    positions, velocities, durations = _pmacTrajectory._calculate_profile(
+        sim_pmac.motor, 1, 5, 9, 1
+    )
+    with pytest.raises(TypeError):
+        positions[sim_pmac.motor] = durations  # type: ignore
+    assert not velocities[sim_pmac.motor].flags.writeable
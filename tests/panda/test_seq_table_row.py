@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from ophyd_async.panda._table import SeqTableRow, SeqTrigger, triggers_to_codes
+
+
+def test_rows_to_soa():
+    rows = [
+        SeqTableRow(repeats=2, position=-5, time1=10, outa1=True, time2=3),
+        SeqTableRow(trigger=SeqTrigger.BITA_1, outf2=True, time2=4),
+    ]
+    columns = SeqTableRow.to_soa(rows)
+    assert columns["trigger"].dtype == np.uint8
+    assert columns["trigger"].tolist() == [0, 2]
+    assert columns["repeats"].dtype == np.uint16
+    assert columns["repeats"].tolist() == [2, 1]
+    assert columns["position"].dtype == np.int32
+    assert columns["position"].tolist() == [-5, 0]
+    assert columns["time2"].dtype == np.uint32
+    assert columns["time2"].tolist() == [3, 4]
+    assert columns["out1"].dtype == np.uint8
+    assert columns["out1"].tolist() == [0b000001, 0]
+    assert columns["out2"].tolist() == [0, 0b100000]
+    assert all(column.flags.c_contiguous for column in columns.values())
+
+
+def test_rows_to_soa_packs_outputs():
+    row = SeqTableRow(outb1=True, outd1=True, outa2=True, outc2=True, oute2=True)
+    columns = SeqTableRow.to_soa([row])
+    assert columns["out1"].tolist() == [0b001010]
+    assert columns["out2"].tolist() == [0b010101]
+    assert "outa1" not in columns
+
+
+def test_triggers_to_codes():
+    codes = triggers_to_codes(list(SeqTrigger))
+    assert codes.dtype == np.uint8
+    assert codes.tolist() == list(range(13))
+    assert triggers_to_codes(codes) is codes
+
+
+@pytest.mark.parametrize(
+    "row, field",
+    [
+        (SeqTableRow(repeats=70000), "repeats"),
+        (SeqTableRow(repeats=-1), "repeats"),
+        (SeqTableRow(position=2**31), "position"),
+        (SeqTableRow(time1=-1), "time1"),
+        (SeqTableRow(time2=2**32), "time2"),
+    ],
+)
+def test_rows_to_soa_rejects_out_of_range_values(row, field):
+    with pytest.raises(ValueError, match=f"{field}: values must be between"):
+        SeqTableRow.to_soa([SeqTableRow(), row])
+
+
+def test_triggers_to_codes_accepts_integer_arrays():
+    codes = triggers_to_codes(np.array([0, 2, 12]))
+    assert codes.dtype == np.uint8
+    assert codes.tolist() == [0, 2, 12]
+    with pytest.raises(ValueError, match="Trigger codes must be between 0 and 12"):
+        triggers_to_codes(np.array([0, 13]))
+    with pytest.raises(ValueError, match="Trigger codes must be between 0 and 12"):
+        triggers_to_codes(np.array([-1]))
+
+
+def test_triggers_to_codes_rejects_other_input():
+    with pytest.raises(TypeError, match="got an array of float64"):
+        triggers_to_codes(np.array([0.0, 2.0]))
+    with pytest.raises(TypeError, match="got 0"):
+        triggers_to_codes([0, 2])  # type: ignore